@@ -1,23 +1,75 @@
+import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+# Process-wide settings applied on import of this module:
+# - TF32 tensor cores for the fp32 Linear matmuls, which changes matmul
+#   numerics for every model in the process
+# - a default caching allocator config. PYTORCH_CUDA_ALLOC_CONF is read when
+#   CUDA initializes, so this is best-effort: it only takes effect if nothing
+#   has initialized CUDA before this import. Set it in the environment or at
+#   the training entry point to rely on it.
+torch.set_float32_matmul_precision('high')
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True,max_split_size_mb:128')
+
 class MLP(nn.Module):
-    def __init__(self, lk_matrix_size, hidden_size, num_invariants):
+    def __init__(self, lk_matrix_size, hidden_size, num_invariants, use_compile=False):
         super(MLP, self).__init__()
 
         self.fc1 = nn.Linear(lk_matrix_size**2, hidden_size)
         self.fc2 = nn.Linear(hidden_size, hidden_size)
         self.fc3 = nn.Linear(hidden_size, num_invariants)
 
-        self.dropout = nn.Dropout(0.3)
+        self.p = 0.3
+
+        self.use_compile = use_compile
+        if use_compile :
+            self._compile()
+
+    def _compile(self) :
+        # input shape is fixed by lk_matrix_size, so let inductor specialize on it
+        self.compile(mode="max-autotune", dynamic=False)
+
+    def __getstate__(self) :
+        # the compiled call is bound to this instance, so copies and pickles
+        # drop it and recompile against their own parameters
+        state = self.__dict__.copy()
+        state['_compiled_call_impl'] = None
+        return state
+
+    def __setstate__(self, state) :
+        super(MLP, self).__setstate__(state)
+        if self.use_compile :
+            self._compile()
 
     def forward(self, x) :
-        x = F.relu(self.fc1(x))
-        x = self.dropout(x)
-        x = F.relu(self.fc2(x))
-        x = self.dropout(x)
-        x = self.fc3(x)
+        # [B, L, L] link matrices -> [B, L*L]; flat [L*L] and [B, L*L] pass through
+        if x.dim() == 3 :
+            x = torch.flatten(x, start_dim=-2)
+        x = F.relu(F.linear(x, self.fc1.weight, self.fc1.bias))
+        x = F.dropout(x, p=self.p, training=self.training)
+        x = F.relu(F.linear(x, self.fc2.weight, self.fc2.bias))
+        x = F.dropout(x, p=self.p, training=self.training)
+        x = F.linear(x, self.fc3.weight, self.fc3.bias)
         return x
 
+    def capture_cuda_graph(self, example_input) :
+        # Returns a callable that replays forward/backward as a single graph launch;
+        # model(x) itself stays eager. Restrictions of the returned callable:
+        # - inputs must match example_input in shape, dtype, device and requires_grad
+        # - its output is a static buffer overwritten by the next call, so consume
+        #   it (and run backward) before calling again
+        # - it is tied to the current parameter storage, so recapture after
+        #   anything that reallocates parameters such as .to() or .half()
+        # - it only replays in the train/eval mode it was captured in and runs
+        #   eagerly otherwise; capture once per mode if both are needed
+        if self.use_compile :
+            raise RuntimeError('capture_cuda_graph cannot be combined with use_compile=True, '
+                               'max-autotune already captures its own CUDA graphs')
+        if not example_input.is_cuda or not all(p.is_cuda for p in self.parameters()) :
+            raise ValueError('capture_cuda_graph needs the model and example_input on a CUDA device')
 
+        torch.cuda.make_graphed_callables(self, (example_input,))
+        # make_graphed_callables patches self.forward; hand it to the caller instead
+        return self.__dict__.pop('forward')
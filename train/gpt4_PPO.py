@@ -129,7 +129,7 @@ def train(env_name, num_epochs=10, steps_per_epoch=100): # num_epochs=1000 steps
     num_inputs = env.observation_space.shape[0]
     num_actions = env.action_space.n
     model = ActorCritic(num_inputs, num_actions).to(device)
-    optimizer = optim.Adam(model.parameters(), lr=3e-4)
+    optimizer = optim.Adam(model.parameters(), lr=3e-4, fused=device.type == "cuda")
     scheduler = noam_scheduler(optimizer, warmup_steps=100, factor=1.0, model_dim=model.hidden_dim) # warmup_steps=4000
 
     memory = Memory()